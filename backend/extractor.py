@@ -1,26 +1,45 @@
 from __future__ import annotations
 
-import json
+import atexit
 import logging
+import multiprocessing.pool
+import os
+import threading
 import time
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
 
-import easyocr
 import fitz  # PyMuPDF
 import numpy as np
-import pdfplumber
+import orjson
 
-from .models import ExtractionArtifacts
+from .models import GLYPH_DTYPE, ExtractionArtifacts
+
+if TYPE_CHECKING:
+    import easyocr
 
 logger = logging.getLogger(__name__)
 
 _EASY_OCR_READER = None
 
+# Text layers take ~15-20 ms a page and the worker pool takes ~0.3 s to start, so
+# fanning out only pays off for long documents (break-even is ~45 pages on 2 cores).
+PARALLEL_MIN_PAGES = 64
+# spawn everywhere (it is the only option on Windows): workers never fork the
+# threaded server or inherit torch state, and they do not import easyocr
+_POOL_CONTEXT = multiprocessing.get_context("spawn")
+_TEXT_LAYER_POOL: Optional[multiprocessing.pool.Pool] = None
+_TEXT_LAYER_POOL_LOCK = threading.Lock()
+OCR_BATCH_SIZE = 4  # Pages rendered and detected together; bounds OCR peak memory
+OCR_DPI = 200
+
 
-def _get_easyocr_reader() -> easyocr.Reader:
+def _get_easyocr_reader() -> "easyocr.Reader":
     global _EASY_OCR_READER
     if _EASY_OCR_READER is None:
+        # Imported here so text-only paths and pool workers never load torch
+        import easyocr
+
         logger.info("Initializing EasyOCR reader (GPU disabled)")
         _EASY_OCR_READER = easyocr.Reader(["en"], gpu=False)
     return _EASY_OCR_READER
@@ -35,78 +54,201 @@ def extract_pdf(pdf_path: Path) -> Tuple[str, Dict]:
     raw_text_parts: List[str] = []
     global_offset = 0
 
-    with pdfplumber.open(str(pdf_path)) as pdf:
-        doc = fitz.open(str(pdf_path))
-        try:
-            for page_index, page in enumerate(pdf.pages):
-                page_chars: List[Dict] = []
+    doc = fitz.open(str(pdf_path))
+    try:
+        text_layers = _extract_text_layers(pdf_path, doc)
+        ocr_results = _ocr_pages(
+            doc, [index for index, (_, _, packed, _) in enumerate(text_layers) if not packed["chars"].size]
+        )
+        for page_index, (width, height, packed, page_text) in enumerate(text_layers):
+            if packed["chars"].size:
+                # Workers emit page-local offsets; rebase onto the document
+                packed["glyphs"]["off"] += global_offset
+                global_offset += len(page_text)
+            else:
+                page_chars = _new_page_chars()
                 page_text_builder: List[str] = []
-                chars = page.chars or []
-
-                if chars:
-                    for item in chars:
-                        char_text = item.get("text", "")
-                        if not char_text:
-                            continue
-                        entry = {
-                            "char": char_text,
-                            "x0": float(item.get("x0", 0.0)),
-                            "y0": float(item.get("top", item.get("y0", 0.0))),
-                            "x1": float(item.get("x1", 0.0)),
-                            "y1": float(item.get("bottom", item.get("y1", 0.0))),
-                            "page": page_index,
-                            "global_offset": global_offset,
-                        }
-                        page_chars.append(entry)
-                        page_text_builder.append(char_text)
-                        global_offset += len(char_text)
-                else:
-                    global_ref = [global_offset]
-                    _inject_ocr_chars(
-                        doc=doc,
-                        page_index=page_index,
-                        page_chars=page_chars,
-                        page_text_builder=page_text_builder,
-                        global_offset_ref=global_ref,
-                    )
-                    global_offset = global_ref[0]
-
-                raw_text_parts.append("".join(page_text_builder))
-                raw_text_parts.append("\n")
-                global_offset += 1  # track newline separator for upcoming pages
-
-                layout["pages"].append(
-                    {
-                        "width": float(page.width),
-                        "height": float(page.height),
-                        "chars": page_chars,
-                    }
+                global_ref = [global_offset]
+                _inject_ocr_chars(
+                    ocr_results=ocr_results[page_index],
+                    page_chars=page_chars,
+                    page_text_builder=page_text_builder,
+                    global_offset_ref=global_ref,
                 )
-        finally:
-            doc.close()
+                global_offset = global_ref[0]
+                packed = _pack_page_chars(page_chars, page_index)
+                page_text = "".join(page_text_builder)
+
+            raw_text_parts.append(page_text)
+            raw_text_parts.append("\n")
+            global_offset += 1  # track newline separator for upcoming pages
+
+            layout["pages"].append({"width": width, "height": height, **packed})
+    finally:
+        doc.close()
 
     raw_text = "".join(raw_text_parts)
     return raw_text, layout
 
 
+def _extract_text_layers(pdf_path: Path, doc: fitz.Document) -> List[Tuple[float, float, Dict, str]]:
+    """Extract the text layer of every page, fanning out to processes for long documents."""
+    page_count = doc.page_count
+    workers = min(os.cpu_count() or 1, page_count)
+    if page_count < PARALLEL_MIN_PAGES or workers < 2:
+        return [_extract_text_layer(page) for page in doc]
+
+    step = -(-page_count // workers)
+    ranges = [(str(pdf_path), start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    chunks = _get_text_layer_pool().map(_extract_page_range, ranges)
+    return [page for chunk in chunks for page in chunk]
+
+
+def _get_text_layer_pool() -> multiprocessing.pool.Pool:
+    """Return the long-lived worker pool, starting it on first use."""
+    global _TEXT_LAYER_POOL
+    with _TEXT_LAYER_POOL_LOCK:
+        if _TEXT_LAYER_POOL is None:
+            _TEXT_LAYER_POOL = _POOL_CONTEXT.Pool(os.cpu_count() or 1)
+            atexit.register(_TEXT_LAYER_POOL.terminate)
+        return _TEXT_LAYER_POOL
+
+
+def _extract_page_range(task: Tuple[str, int, int]) -> List[Tuple[float, float, Dict, str]]:
+    """Pool worker: extract pages [start, end) from its own document handle."""
+    pdf_path, start, end = task
+    doc = fitz.open(pdf_path)
+    try:
+        return [_extract_text_layer(doc.load_page(index)) for index in range(start, end)]
+    finally:
+        doc.close()
+
+
+def _extract_text_layer(page: fitz.Page) -> Tuple[float, float, Dict, str]:
+    """Return page size, packed glyphs (page-local offsets) and page text."""
+    raw = page.get_text("rawdict")
+    spans = [
+        span
+        for block in raw.get("blocks", [])
+        for line in block.get("lines", [])
+        for span in line.get("spans", [])
+    ]
+
+    # rawdict gives the glyph count up front, so fill preallocated arrays in place
+    capacity = sum(len(span.get("chars", [])) for span in spans)
+    glyphs = np.empty(capacity, dtype=GLYPH_DTYPE)
+    chars = np.empty(capacity, dtype="U1")
+    count = 0
+    for span in spans:
+        for item in span.get("chars", []):
+            char_text = item.get("c", "")
+            if not char_text:
+                continue
+            x0, y0, x1, y1 = item["bbox"]
+            glyphs[count] = (count, page.number, x0, y0, x1, y1)
+            chars[count] = char_text
+            count += 1
+
+    if count < capacity:
+        glyphs = glyphs[:count].copy()
+        chars = chars[:count].copy()
+    return (
+        float(page.rect.width),
+        float(page.rect.height),
+        {"glyphs": glyphs, "chars": chars},
+        "".join(chars.tolist()),
+    )
+
+
+def _new_page_chars() -> Dict[str, List]:
+    return {"chars": [], "offsets": [], "x0": [], "y0": [], "x1": [], "y1": []}
+
+
+def _append_char(
+    page_chars: Dict[str, List],
+    char: str,
+    bbox: Sequence[float],
+    offset: int,
+) -> None:
+    x0, y0, x1, y1 = bbox
+    page_chars["chars"].append(char)
+    page_chars["offsets"].append(offset)
+    page_chars["x0"].append(x0)
+    page_chars["y0"].append(y0)
+    page_chars["x1"].append(x1)
+    page_chars["y1"].append(y1)
+
+
+def _pack_page_chars(page_chars: Dict[str, List], page_index: int) -> Dict:
+    """Convert per-page char buffers into a GLYPH_DTYPE array plus parallel glyph text."""
+    glyphs = np.empty(len(page_chars["chars"]), dtype=GLYPH_DTYPE)
+    glyphs["off"] = page_chars["offsets"]
+    glyphs["page"] = page_index
+    for key in ("x0", "y0", "x1", "y1"):
+        glyphs[key] = page_chars[key]
+    return {"glyphs": glyphs, "chars": np.asarray(page_chars["chars"], dtype="U1")}
+
+
+def _render_page(doc: fitz.Document, page_index: int) -> np.ndarray:
+    page = doc.load_page(page_index)
+    # MuPDF renders straight to packed RGB, so the buffer needs no alpha slicing
+    pix = page.get_pixmap(dpi=OCR_DPI, alpha=False, colorspace=fitz.csRGB)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+
+
+def _ocr_pages(doc: fitz.Document, page_indices: Sequence[int]) -> Dict[int, List]:
+    """Run EasyOCR over image-only pages, OCR_BATCH_SIZE pages per batched call.
+
+    EasyOCR runs text detection over the whole image list in one forward pass, so
+    slices are rendered and recognised one at a time to bound peak memory.
+    """
+    results: Dict[int, List] = {}
+    for start in range(0, len(page_indices), OCR_BATCH_SIZE):
+        batch = page_indices[start:start + OCR_BATCH_SIZE]
+        results.update(_ocr_page_batch(doc, batch))
+    return results
+
+
+def _ocr_page_batch(doc: fitz.Document, page_indices: Sequence[int]) -> Dict[int, List]:
+    images = [_render_page(doc, index) for index in page_indices]
+    shapes = {image.shape[:2] for image in images}
+    if len(shapes) == 1:
+        n_width = n_height = None
+    else:
+        # Mixed page sizes: EasyOCR resizes every image to a common shape
+        n_height = max(height for height, _ in shapes)
+        n_width = max(width for _, width in shapes)
+
+    reader = _get_easyocr_reader()
+    batched = reader.readtext_batched(
+        images,
+        n_width=n_width,
+        n_height=n_height,
+        batch_size=OCR_BATCH_SIZE,
+        detail=1,
+    )
+
+    # Map boxes back from (resized) pixel space to PDF points
+    points_per_pixel = 72.0 / OCR_DPI
+    results: Dict[int, List] = {}
+    for page_index, image, page_results in zip(page_indices, images, batched):
+        scale_x = (image.shape[1] / n_width if n_width else 1.0) * points_per_pixel
+        scale_y = (image.shape[0] / n_height if n_height else 1.0) * points_per_pixel
+        results[page_index] = [
+            ([(x * scale_x, y * scale_y) for x, y in bbox], text, confidence)
+            for bbox, text, confidence in page_results
+        ]
+    return results
+
+
 def _inject_ocr_chars(
     *,
-    doc: fitz.Document,
-    page_index: int,
-    page_chars: List[Dict],
+    ocr_results: Sequence,
+    page_chars: Dict[str, List],
     page_text_builder: List[str],
     global_offset_ref: List[int],
 ) -> None:
-    """Populate page_chars/text using EasyOCR for image-only pages."""
-    reader = _get_easyocr_reader()
-    page = doc.load_page(page_index)
-    pix = page.get_pixmap(matrix=fitz.Matrix(1, 1))
-    array = np.frombuffer(pix.samples, dtype=np.uint8)
-    array = array.reshape(pix.height, pix.width, pix.n)
-    if pix.n == 4:
-        array = array[:, :, :3]
-
-    ocr_results = reader.readtext(array, detail=1)
+    """Populate page_chars/text from EasyOCR results for an image-only page."""
     for bbox, text, confidence in ocr_results:
         sanitized = text.strip()
         if not sanitized:
@@ -117,16 +259,12 @@ def _inject_ocr_chars(
         y0, y1 = float(min(y_coords)), float(max(y_coords))
         char_width = (x1 - x0) / max(len(sanitized), 1)
         for idx, char in enumerate(sanitized):
-            entry = {
-                "char": char,
-                "x0": x0 + idx * char_width,
-                "y0": y0,
-                "x1": x0 + (idx + 1) * char_width,
-                "y1": y1,
-                "page": page_index,
-                "global_offset": global_offset_ref[0],
-            }
-            page_chars.append(entry)
+            _append_char(
+                page_chars,
+                char,
+                (x0 + idx * char_width, y0, x0 + (idx + 1) * char_width, y1),
+                global_offset_ref[0],
+            )
             page_text_builder.append(char)
             global_offset_ref[0] += 1
         page_text_builder.append(" ")
@@ -139,8 +277,13 @@ def persist_artifacts(
     raw_text: str,
     layout: Dict,
     extracted: Dict,
+    defer_layout: bool = False,
 ) -> ExtractionArtifacts:
-    """Write raw_text/layout/extracted outputs next to the PDF."""
+    """Write raw_text/layout/extracted outputs next to the PDF.
+
+    With defer_layout the layout path is only reserved; the caller is expected
+    to write it later with write_layout (it is not needed to answer requests).
+    """
     timestamp = int(time.time())
     base_name = pdf_path.stem
     parent = pdf_path.parent
@@ -150,8 +293,9 @@ def persist_artifacts(
     extracted_path = parent / f"{base_name}_{timestamp}_extracted.json"
 
     raw_text_path.write_text(raw_text, encoding="utf-8")
-    layout_path.write_text(json.dumps(layout, ensure_ascii=True, indent=2), encoding="utf-8")
-    extracted_path.write_text(json.dumps(extracted, ensure_ascii=True, indent=2), encoding="utf-8")
+    if not defer_layout:
+        write_layout(layout_path, layout)
+    extracted_path.write_bytes(orjson.dumps(extracted, option=orjson.OPT_INDENT_2))
 
     return ExtractionArtifacts(
         pdf_path=pdf_path,
@@ -160,3 +304,27 @@ def persist_artifacts(
         extracted_json_path=extracted_path,
         raw_text=raw_text,
     )
+
+
+def write_layout(layout_path: Path, layout: Dict) -> None:
+    """Write the per-glyph layout JSON (the largest artifact)."""
+    layout_path.write_bytes(
+        orjson.dumps(_layout_to_json(layout), option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    )
+
+
+def _layout_to_json(layout: Dict) -> Dict:
+    """Split glyph records into contiguous per-field columns that orjson can encode."""
+    pages = []
+    for page in layout.get("pages", []):
+        glyphs = page["glyphs"]
+        pages.append(
+            {
+                "width": page["width"],
+                "height": page["height"],
+                "chars": page["chars"].tolist(),
+                "offsets": np.ascontiguousarray(glyphs["off"]),
+                **{key: np.ascontiguousarray(glyphs[key]) for key in ("x0", "y0", "x1", "y1")},
+            }
+        )
+    return {"pages": pages}
@@ -1,28 +1,34 @@
 from __future__ import annotations
 
-import shutil
+import logging
 import time
 from pathlib import Path
 from typing import Annotated
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
+import aiofiles
+import numpy as np
+from fastapi import BackgroundTasks, FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 
 try:
-    from .extractor import extract_pdf, persist_artifacts
-    from .mapper import map_fields_to_rects
+    from .extractor import _get_easyocr_reader, extract_pdf, persist_artifacts, write_layout
+    from .mapper import map_fields_to_rects, strategy_hit_counts
     from .models import UploadResponse
-    from .structurer import structure_with_groq
+    from .structurer import structure_with_groq, warmup as warmup_groq
 except ImportError:
-    from extractor import extract_pdf, persist_artifacts
-    from mapper import map_fields_to_rects
+    from extractor import _get_easyocr_reader, extract_pdf, persist_artifacts, write_layout
+    from mapper import map_fields_to_rects, strategy_hit_counts
     from models import UploadResponse
-    from structurer import structure_with_groq
+    from structurer import structure_with_groq, warmup as warmup_groq
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
 
 app = FastAPI(title="PDF Extraction API", version="1.0.0")
 app.add_middleware(
@@ -34,13 +40,33 @@ app.add_middleware(
 )
 
 
+def _warm_ocr() -> None:
+    reader = _get_easyocr_reader()
+    # One tiny inference primes the torch kernels used by the first real OCR call
+    reader.readtext(np.zeros((64, 64, 3), dtype=np.uint8))
+
+
+@app.on_event("startup")
+async def _warmup() -> None:
+    await warmup_groq()
+    try:
+        await run_in_threadpool(_warm_ocr)
+    except Exception as exc:
+        logger.warning("EasyOCR warm-up failed; reader will load on first OCR page: %s", exc)
+
+
 @app.get("/")
 async def root():
     return {"message": "PDF Extraction API", "status": "running"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {"mapper_strategy_hits": strategy_hit_counts()}
+
+
 @app.post("/api/upload", response_model=UploadResponse)
-async def upload_pdf(file: Annotated[UploadFile, File(...)]):
+async def upload_pdf(file: Annotated[UploadFile, File(...)], background_tasks: BackgroundTasks):
     if file.content_type not in {"application/pdf", "application/octet-stream"}:
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
@@ -49,19 +75,25 @@ async def upload_pdf(file: Annotated[UploadFile, File(...)]):
     target_name = f"{timestamp}_{Path(sanitized_name).name}"
     target_path = UPLOAD_DIR / target_name
 
-    with target_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    async with aiofiles.open(target_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
 
-    raw_text, layout = extract_pdf(target_path)
-    structured = structure_with_groq(raw_text)
-    mapped = map_fields_to_rects(structured, raw_text, layout)
+    # The pipeline stages are blocking (CPU/network); keep them off the event loop.
+    raw_text, layout = await run_in_threadpool(extract_pdf, target_path)
+    structured = await structure_with_groq(raw_text)
+    mapped = await run_in_threadpool(map_fields_to_rects, structured, raw_text, layout)
 
-    artifacts = persist_artifacts(
+    artifacts = await run_in_threadpool(
+        persist_artifacts,
         pdf_path=target_path,
         raw_text=raw_text,
         layout=layout,
         extracted=mapped,
+        defer_layout=True,
     )
+    # The layout dump is never read by the response; write it after sending it
+    background_tasks.add_task(write_layout, artifacts.layout_path, layout)
 
     return UploadResponse(
         pdf_path=artifacts.pdf_path.name,
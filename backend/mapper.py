@@ -1,9 +1,27 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, List, Sequence, Tuple, Optional
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Optional
 
-from .models import ExtractedField, FieldRect
+import ahocorasick
+import numpy as np
+from rapidfuzz import fuzz
+
+from .models import GLYPH_DTYPE, ExtractedField, FieldRect
+
+_WS_RE = re.compile(r"\s+")
+_LITERAL_STRATEGIES = (
+    "exact_snippet",
+    "exact_value",
+    "case_insensitive_snippet",
+    "case_insensitive_value",
+)
+
+# Per-strategy hit counts, exposed via /metrics to spot strategies that never fire
+_STRATEGY_HITS: Counter = Counter()
+_STRATEGY_HITS_LOCK = threading.Lock()
 
 
 def map_fields_to_rects(structured: Dict, raw_text: str, layout: Dict) -> Dict:
@@ -17,23 +35,39 @@ def map_fields_to_rects(structured: Dict, raw_text: str, layout: Dict) -> Dict:
         for index, page in enumerate(pages)
     }
     flat_chars = _flatten_chars(pages)
+    # Lowercased/whitespace-normalized views are shared by every field lookup.
+    raw_lower = raw_text.lower()
+    raw_normalized, norm_to_orig = _normalize_whitespace(raw_lower)
     mapped_fields: List[Dict] = []
+    hits: Counter = Counter()
 
+    entries: List[Tuple[str, str, str]] = []
     for field in fields:
         label = field.get("label") or field.get("name") or "Unknown"
         value = str(field.get("value", "")).strip()
         snippet = str(field.get("snippet", "")).strip() or value
+        entries.append((label, value, snippet))
 
+    # Strategies 1-4 (exact/case-insensitive) for every field in one pass over the text
+    literal_matches = _find_literal_matches(
+        raw_text, raw_lower, [(snippet, value) for _, value, snippet in entries]
+    )
+
+    for index, (label, value, snippet) in enumerate(entries):
         # Try multiple matching strategies for better accuracy
-        offsets = _find_best_match(raw_text, snippet, value)
+        strategy, offsets = _find_best_match(
+            raw_lower, raw_normalized, norm_to_orig, snippet, value, literal_matches.get(index)
+        )
+        hits[strategy] += 1
         
         rects: List[FieldRect] = []
         if offsets:
             start, end = offsets
             rects = _offset_to_rects(start, end, flat_chars, page_sizes)
 
+        # Inputs are already typed (str/int/float), so skip per-instance validation
         mapped_fields.append(
-            ExtractedField(
+            ExtractedField.model_construct(
                 label=label,
                 value=value,
                 snippet=snippet,
@@ -41,197 +75,210 @@ def map_fields_to_rects(structured: Dict, raw_text: str, layout: Dict) -> Dict:
             ).model_dump()
         )
 
+    with _STRATEGY_HITS_LOCK:
+        _STRATEGY_HITS.update(hits)
+
     return {"fields": mapped_fields}
 
 
-def _find_best_match(raw_text: str, snippet: str, value: str) -> Optional[Tuple[int, int]]:
-    """Try multiple matching strategies to find the best match."""
-    
-    # Strategy 1: Exact match on snippet
-    offsets = _find_exact_offsets(raw_text, snippet)
-    if offsets:
-        return offsets[0]
-    
-    # Strategy 2: Exact match on value
-    if value and value != snippet:
-        offsets = _find_exact_offsets(raw_text, value)
-        if offsets:
-            return offsets[0]
-    
-    # Strategy 3: Case-insensitive match on snippet
-    offsets = _find_case_insensitive_offsets(raw_text, snippet)
-    if offsets:
-        return offsets[0]
-    
-    # Strategy 4: Case-insensitive match on value
-    if value and value != snippet:
-        offsets = _find_case_insensitive_offsets(raw_text, value)
-        if offsets:
-            return offsets[0]
-    
+def strategy_hit_counts() -> Dict[str, int]:
+    """Process-wide count of fields resolved by each matching strategy."""
+    with _STRATEGY_HITS_LOCK:
+        return dict(_STRATEGY_HITS)
+
+
+def _find_best_match(
+    raw_lower: str,
+    raw_normalized: str,
+    norm_to_orig: np.ndarray,
+    snippet: str,
+    value: str,
+    literal_match: Optional[Tuple[str, Tuple[int, int]]] = None,
+) -> Tuple[str, Optional[Tuple[int, int]]]:
+    """Try multiple matching strategies to find the best match.
+
+    Returns the name of the strategy that hit (or "unmatched") with its span.
+    """
+
+    # Strategies 1-4: exact then case-insensitive on snippet/value (see _find_literal_matches)
+    if literal_match:
+        return literal_match
+
+    # No strategy accepts needles shorter than two characters
+    if len(snippet) < 2 and len(value) < 2:
+        return "unmatched", None
+
+    for name, strategy in _fallback_strategies(raw_lower, raw_normalized, norm_to_orig, snippet, value):
+        result = strategy()
+        if result:
+            return name, result
+
+    return "unmatched", None
+
+
+def _fallback_strategies(
+    raw_lower: str,
+    raw_normalized: str,
+    norm_to_orig: np.ndarray,
+    snippet: str,
+    value: str,
+) -> Iterator[Tuple[str, Callable[[], Optional[Tuple[int, int]]]]]:
+    """Yield strategies 5-7 lazily in cost-ascending order."""
+
+    def first(offsets: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        return offsets[0] if offsets else None
+
     # Strategy 5: Normalized whitespace match
-    offsets = _find_normalized_offsets(raw_text, snippet)
-    if offsets:
-        return offsets[0]
-    
+    yield "normalized_snippet", lambda: first(_find_normalized_offsets(raw_normalized, norm_to_orig, snippet))
+
     # Strategy 6: Try with value normalized
     if value and value != snippet:
-        offsets = _find_normalized_offsets(raw_text, value)
-        if offsets:
-            return offsets[0]
-    
-    # Strategy 7: Fuzzy match - find longest matching substring
-    result = _find_fuzzy_match(raw_text, snippet if snippet else value)
-    if result:
-        return result
-    
-    return None
+        yield "normalized_value", lambda: first(_find_normalized_offsets(raw_normalized, norm_to_orig, value))
 
+    # Strategy 7: Fuzzy match - best approximate alignment
+    yield "fuzzy", lambda: _find_fuzzy_match(raw_lower, snippet if snippet else value)
 
-def _flatten_chars(pages: Sequence[Dict]) -> List[Dict]:
-    flat: List[Dict] = []
-    for page in pages:
-        for ch in page.get("chars", []):
-            flat.append(ch)
-    flat.sort(key=lambda item: item.get("global_offset", 0))
-    return flat
 
+def _find_literal_matches(
+    raw_text: str,
+    raw_lower: str,
+    queries: Sequence[Tuple[str, str]],
+) -> Dict[int, Tuple[str, Tuple[int, int]]]:
+    """Resolve exact and case-insensitive matches for all (snippet, value) queries at once.
 
-def _find_exact_offsets(raw_text: str, snippet: str) -> List[Tuple[int, int]]:
-    """Find exact match (case-sensitive) for the snippet."""
-    snippet_clean = (snippet or "").strip()
-    if not snippet_clean or len(snippet_clean) < 2:
-        return []
-    offsets: List[Tuple[int, int]] = []
-    start = raw_text.find(snippet_clean)
-    while start != -1:
-        offsets.append((start, start + len(snippet_clean)))
-        start = raw_text.find(snippet_clean, start + 1)
-    return offsets
+    Builds one Aho-Corasick automaton per text view so the document is scanned
+    once regardless of field count. Returns the first occurrence for the
+    highest-priority strategy that hit (see _LITERAL_STRATEGIES) with the
+    strategy name, keyed by query index.
+    """
+    exact_patterns: Dict[str, List[Tuple[int, int]]] = {}
+    lower_patterns: Dict[str, List[Tuple[int, int]]] = {}
+    for index, (snippet, value) in enumerate(queries):
+        candidates = [snippet]
+        if value and value != snippet:
+            candidates.append(value)
+        for rank, candidate in enumerate(candidates):
+            if len(candidate) < 2:
+                continue
+            exact_patterns.setdefault(candidate, []).append((index, rank))
+            lower_patterns.setdefault(candidate.lower(), []).append((index, 2 + rank))
 
+    hits: Dict[int, Dict[int, Tuple[int, int]]] = {}
+    for haystack, patterns in ((raw_text, exact_patterns), (raw_lower, lower_patterns)):
+        if not patterns:
+            continue
+        automaton = ahocorasick.Automaton()
+        for pattern in patterns:
+            automaton.add_word(pattern, pattern)
+        automaton.make_automaton()
 
-def _find_case_insensitive_offsets(raw_text: str, snippet: str) -> List[Tuple[int, int]]:
-    """Find case-insensitive match for the snippet."""
-    snippet_clean = (snippet or "").strip()
-    if not snippet_clean or len(snippet_clean) < 2:
-        return []
-    haystack = raw_text.lower()
-    needle = snippet_clean.lower()
-    offsets: List[Tuple[int, int]] = []
-    start = haystack.find(needle)
-    while start != -1:
-        offsets.append((start, start + len(snippet_clean)))
-        start = haystack.find(needle, start + 1)
-    return offsets
+        first_seen = set()
+        for end_index, pattern in automaton.iter(haystack):
+            if pattern in first_seen:
+                continue
+            first_seen.add(pattern)
+            start = end_index - len(pattern) + 1
+            for index, rank in patterns[pattern]:
+                hits.setdefault(index, {})[rank] = (start, start + len(queries[index][rank % 2]))
+
+    return {
+        index: (_LITERAL_STRATEGIES[min(ranked)], ranked[min(ranked)])
+        for index, ranked in hits.items()
+    }
+
+
+def _flatten_chars(pages: Sequence[Dict]) -> np.ndarray:
+    """Stack per-page glyph records; pages are already in global_offset order."""
+    glyphs = [page["glyphs"] for page in pages if "glyphs" in page]
+    return np.concatenate(glyphs) if glyphs else np.empty(0, dtype=GLYPH_DTYPE)
 
 
-def _find_normalized_offsets(raw_text: str, snippet: str) -> List[Tuple[int, int]]:
+def _normalize_whitespace(raw_lower: str) -> Tuple[str, np.ndarray]:
+    """Collapse whitespace runs to one space and index each kept char in the original text."""
+    keep = np.ones(len(raw_lower), dtype=bool)
+    for match in _WS_RE.finditer(raw_lower):
+        keep[match.start() + 1 : match.end()] = False
+    return _WS_RE.sub(" ", raw_lower), np.flatnonzero(keep)
+
+
+def _find_normalized_offsets(
+    normalized_text: str,
+    norm_to_orig: np.ndarray,
+    snippet: str,
+) -> List[Tuple[int, int]]:
     """Find match with normalized whitespace."""
     snippet_clean = (snippet or "").strip()
     if not snippet_clean or len(snippet_clean) < 2:
         return []
     
-    # Normalize whitespace in both texts
-    normalized_snippet = re.sub(r'\s+', ' ', snippet_clean.lower())
-    normalized_text = re.sub(r'\s+', ' ', raw_text.lower())
+    # Normalize whitespace in the snippet; the text is normalized once by the caller
+    normalized_snippet = _WS_RE.sub(" ", snippet_clean.lower())
     
     start = normalized_text.find(normalized_snippet)
     if start == -1:
         return []
     
-    # Map back to original text position (approximate)
-    # Count spaces before this position in normalized text
-    original_pos = 0
-    normalized_pos = 0
-    while normalized_pos < start and original_pos < len(raw_text):
-        if raw_text[original_pos].isspace():
-            if normalized_pos == 0 or normalized_text[normalized_pos - 1] != ' ':
-                normalized_pos += 1
-        else:
-            normalized_pos += 1
-        original_pos += 1
-    
-    return [(original_pos, original_pos + len(snippet_clean))]
+    # Map the normalized span back to the original text
+    end = start + len(normalized_snippet)
+    return [(int(norm_to_orig[start]), int(norm_to_orig[end - 1]) + 1)]
 
 
-def _find_fuzzy_match(raw_text: str, snippet: str) -> Optional[Tuple[int, int]]:
-    """Find the longest matching substring using sliding window."""
+def _find_fuzzy_match(raw_lower: str, snippet: str) -> Optional[Tuple[int, int]]:
+    """Find the best approximate alignment of the snippet within the text."""
     snippet_clean = (snippet or "").strip()
     if not snippet_clean or len(snippet_clean) < 3:
         return None
-    
-    raw_lower = raw_text.lower()
-    snippet_lower = snippet_clean.lower()
-    
-    # Try to find progressively shorter substrings
-    min_match_len = max(3, len(snippet_clean) // 2)
-    
-    for length in range(len(snippet_clean), min_match_len - 1, -1):
-        for start_pos in range(len(snippet_clean) - length + 1):
-            substring = snippet_lower[start_pos:start_pos + length]
-            idx = raw_lower.find(substring)
-            if idx != -1:
-                return (idx, idx + length)
-    
-    return None
+
+    alignment = fuzz.partial_ratio_alignment(snippet_clean.lower(), raw_lower, score_cutoff=70)
+    if alignment is None:
+        return None
+    return (alignment.dest_start, alignment.dest_end)
 
 
 def _offset_to_rects(
     start: int,
     end: int,
-    chars: Sequence[Dict],
+    glyphs: np.ndarray,
     page_sizes: Dict[int, Tuple[float, float]],
 ) -> List[FieldRect]:
     """Convert text offsets to precise bounding rectangles."""
-    relevant = [ch for ch in chars if start <= ch.get("global_offset", -1) < end]
-    if not relevant:
+    # Offsets are sorted, so the field's chars form one contiguous slice
+    offsets = glyphs["off"]
+    lo = int(np.searchsorted(offsets, start, "left"))
+    hi = int(np.searchsorted(offsets, end, "left"))
+    if lo >= hi:
         return []
 
+    relevant = glyphs[lo:hi]
+    off = relevant["off"]
+    page = relevant["page"]
+    x0 = relevant["x0"]
+    y0 = relevant["y0"]
+    x1 = relevant["x1"]
+    y1 = relevant["y1"]
+
+    # Only merge if same page, consecutive, and same line (similar y position)
+    breaks = (np.diff(off) > 1) | (np.diff(page) != 0) | (np.abs(np.diff(y0)) >= 5)
+    group_starts = np.flatnonzero(np.r_[True, breaks])
+
     rects: List[FieldRect] = []
-    current = None
-    previous_offset = None
-    previous_y = None
-
-    for ch in relevant:
-        offset = ch.get("global_offset", 0)
-        page = int(ch.get("page", 0))
-        x0 = float(ch.get("x0", 0.0))
-        y0 = float(ch.get("y0", 0.0))
-        x1 = float(ch.get("x1", 0.0))
-        y1 = float(ch.get("y1", 0.0))
-
-        # Only merge if same page, consecutive, and same line (similar y position)
-        same_line = previous_y is not None and abs(y0 - previous_y) < 5
-        should_merge = (
-            current is not None
-            and current["page"] == page
-            and previous_offset is not None
-            and offset - previous_offset <= 1
-            and same_line
+    for rect_page, rx0, ry0, rx1, ry1 in zip(
+        page[group_starts].tolist(),
+        np.minimum.reduceat(x0, group_starts).tolist(),
+        np.minimum.reduceat(y0, group_starts).tolist(),
+        np.maximum.reduceat(x1, group_starts).tolist(),
+        np.maximum.reduceat(y1, group_starts).tolist(),
+    ):
+        width, height = page_sizes.get(rect_page, (1.0, 1.0))
+        rects.append(
+            FieldRect.model_construct(
+                page=rect_page,
+                x0=rx0,
+                y0=ry0,
+                x1=rx1,
+                y1=ry1,
+                page_width=width,
+                page_height=height,
+            )
         )
-
-        if should_merge:
-            current["x0"] = min(current["x0"], x0)
-            current["y0"] = min(current["y0"], y0)
-            current["x1"] = max(current["x1"], x1)
-            current["y1"] = max(current["y1"], y1)
-        else:
-            if current:
-                rects.append(FieldRect(**current))
-            width, height = page_sizes.get(page, (1.0, 1.0))
-            current = {
-                "page": page,
-                "x0": x0,
-                "y0": y0,
-                "x1": x1,
-                "y1": y1,
-                "page_width": width,
-                "page_height": height,
-            }
-
-        previous_offset = offset
-        previous_y = y0
-
-    if current:
-        rects.append(FieldRect(**current))
     return rects
@@ -3,8 +3,21 @@ from __future__ import annotations
 from pathlib import Path
 from typing import List, Optional
 
+import numpy as np
 from pydantic import BaseModel, Field
 
+# One record per glyph in layout["pages"][i]["glyphs"]; 22 bytes, unaligned.
+GLYPH_DTYPE = np.dtype(
+    [
+        ("off", "i4"),
+        ("page", "i2"),
+        ("x0", "f4"),
+        ("y0", "f4"),
+        ("x1", "f4"),
+        ("y1", "f4"),
+    ]
+)
+
 
 class FieldRect(BaseModel):
     page: int
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
 import os
+import random
 import re
+import threading
+import weakref
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Tuple
 
-import requests
+import httpx
+import ijson
+import orjson
 from dotenv import load_dotenv
 
 # Load .env file from the project root
@@ -15,32 +23,447 @@ env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 logger = logging.getLogger(__name__)
+
+FieldCallback = Callable[[Dict], None]
 GROQ_ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODELS_ENDPOINT = "https://api.groq.com/openai/v1/models"
 MODEL_NAME = "llama-3.3-70b-versatile"  # More capable model for better extraction
 
+GROQ_CHUNK_SIZE = 25000  # Characters per request; also the budget for a document batch
+GROQ_MAX_CONCURRENCY = 8  # In-flight chunk requests per document
+GROQ_DOCUMENT_CONCURRENCY = 16  # Documents structured at once by structure_many
+
+# Per-attempt read timeout (seconds): a stalled call is abandoned and retried. Full
+# extraction responses can take tens of seconds, so this is not short.
+GROQ_REQUEST_TIMEOUT = float(os.getenv("GROQ_REQUEST_TIMEOUT", "60"))
+# Budget for one chunk across all attempts and backoff (the old single call's 120 s)
+GROQ_TOTAL_TIMEOUT = float(os.getenv("GROQ_TOTAL_TIMEOUT", "120"))
+GROQ_MAX_ATTEMPTS = 3
+GROQ_MAX_RETRY_WAIT = 10.0  # Longer Retry-After waits (e.g. daily token limits) fail fast
+_MIN_ATTEMPT_TIME = 5.0  # Do not start a retry with less budget than this left
+_RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+_ERROR_BODY_LIMIT = 500  # Characters of an error response kept in the log
+
+# Regex fast path (0 disables): Groq is skipped entirely when the regex pass finds
+# at least this many fields; otherwise Groq runs and any regex matches it missed
+# are appended to its answer. The skip is all-or-nothing per document.
+GROQ_LOCAL_MIN_FIELDS = int(os.getenv("GROQ_LOCAL_MIN_FIELDS", "0"))
+
+# Bump whenever the extraction prompt changes so cached answers are not reused
+PROMPT_VERSION = "1"
+
+# Responses are cached by content hash so re-uploads skip the API: a small
+# in-memory LRU in front of an on-disk tier that survives restarts
+GROQ_CACHE_DIR = Path(__file__).resolve().parent / "uploads" / ".groq_cache"
+GROQ_CACHE_MAX_ENTRIES = 256
+GROQ_MEMORY_CACHE_MAX_ENTRIES = 512
+
+_HSPACE_RE = re.compile(r"[^\S\n]+")
+_LOCAL_PATTERNS = (
+    ("Date", re.compile(r"\b(?:\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{4}-\d{2}-\d{2})\b")),
+    ("Amount", re.compile(r"\$\s?\d{1,3}(?:,\d{3})*(?:\.\d{2})?")),
+    ("Policy Number", re.compile(r"\b[A-Z]{2,4}[-\s]?\d{5,}\b")),
+)
+_DEDUP_MIN_LINE_LENGTH = 40  # Short lines (totals, "N/A") legitimately repeat
+
+_MEMORY_CACHE: "OrderedDict[str, Dict]" = OrderedDict()
+_MEMORY_CACHE_LOCK = threading.Lock()
+
+_EXTRACTION_RULES = """CRITICAL RULES:
+1. The 'snippet' field MUST contain the EXACT text as it appears in the document - copy it character by character
+2. Extract EVERY piece of information: headers, labels, values, table cells, dates, amounts, IDs, names, descriptions
+3. For table data, use label format: "TableName[row].ColumnName" (e.g., "Claims[0].Amount")
+4. Do NOT paraphrase or modify the text - use exact matches only
+5. Include ALL rows from ALL tables
+6. Extract both the label/header AND its corresponding value"""
+
+SYSTEM_PROMPT = f"""You are a precise document extraction assistant. Extract ALL data from the document text.
+
+{_EXTRACTION_RULES}
+
+Return JSON with format:
+{{
+  "fields": [
+    {{"label": "descriptive_name", "value": "the extracted value", "snippet": "EXACT text from document"}}
+  ]
+}}
+
+The snippet is used to locate and highlight the text in the PDF, so it MUST be an exact substring from the input."""
+
+_BATCH_SYSTEM_PROMPT = f"""You are a precise document extraction assistant. The input contains several documents, each introduced by a "===DOC n===" marker. Extract ALL data from every document.
+
+{_EXTRACTION_RULES}
+7. Keep each document's fields separate and never mix data between documents
+
+Return JSON with exactly one entry per document, in input order:
+{{
+  "results": [
+    {{"fields": [{{"label": "descriptive_name", "value": "the extracted value", "snippet": "EXACT text from document"}}]}}
+  ]
+}}
+
+The snippet is used to locate and highlight the text in the PDF, so it MUST be an exact substring from its document."""
+
+_USER_PROMPT_PREFIX = """Extract ALL data from this document section. For each piece of data:
+- label: A descriptive name for the field
+- value: The actual value/content
+- snippet: The EXACT text as it appears (copy-paste from document)
+
+Document text:
+"""
+_USER_PROMPT_SUFFIX = """
+
+Return compact JSON only."""
+
+# Invariant request parts are built once; each call only adds the user message
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+_BATCH_SYSTEM_MESSAGE = {"role": "system", "content": _BATCH_SYSTEM_PROMPT}
+_PAYLOAD_BASE = {
+    "model": MODEL_NAME,
+    "temperature": 0.1,  # Lower temperature for more accurate extraction
+    "max_tokens": 8000,
+    "response_format": {"type": "json_object"},
+}
+
+# One pooled client per event loop, as (api_key, client); entries vanish with their loop
+_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_HTTP_CLIENTS_LOCK = threading.Lock()
+_CLOSING_CLIENTS: "Set[asyncio.Task[None]]" = set()
+_WARMED_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client(api_key: str) -> httpx.AsyncClient:
+    """Return a shared keep-alive HTTP/2 client so chunks reuse one TLS connection.
+
+    Pooled connections belong to the event loop that opened them, so each loop
+    gets its own client; a client replaced after a key change is closed.
+    """
+    loop = asyncio.get_running_loop()
+    with _HTTP_CLIENTS_LOCK:
+        entry = _HTTP_CLIENTS.get(loop)
+        if entry is not None and entry[0] == api_key:
+            return entry[1]
+        # No transport-level retries: _post_with_retries is the only retry layer
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        )
+        client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(90.0, connect=5.0),
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        )
+        _HTTP_CLIENTS[loop] = (api_key, client)
+    if entry is not None:
+        # The loop only keeps a weak reference to tasks, so hold one until the close finishes
+        task = loop.create_task(entry[1].aclose())
+        _CLOSING_CLIENTS.add(task)
+        task.add_done_callback(_on_client_closed)
+    return client
+
+
+def _on_client_closed(task: "asyncio.Task[None]") -> None:
+    _CLOSING_CLIENTS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Closing a replaced Groq client failed: %s", task.exception())
+
+
+async def _close_http_client() -> None:
+    """Close and forget the running loop's client, if it has one."""
+    with _HTTP_CLIENTS_LOCK:
+        entry = _HTTP_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
+async def warmup() -> None:
+    """Open the keep-alive connection to Groq ahead of the first real request.
+
+    The client speaks HTTP/2, so one connection carries all concurrent chunk
+    requests and a single GET establishes it (DNS, TCP, TLS, ALPN).
+    Idempotent per client and never raises, so it is safe in a startup hook.
+    """
+    global _WARMED_CLIENT
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        return
+    client = _get_http_client(api_key)
+    if _WARMED_CLIENT is client:
+        return
+    _WARMED_CLIENT = client
+    try:
+        await client.get(GROQ_MODELS_ENDPOINT, timeout=5.0)
+    except Exception as exc:  # Warm-up is best effort; the first upload will connect anyway
+        logger.info("Groq connection warm-up failed: %s", exc)
+
+
+async def structure_many(
+    texts: Sequence[str],
+    concurrency: int = GROQ_DOCUMENT_CONCURRENCY,
+) -> List[Dict]:
+    """Structure several documents concurrently; results follow the input order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(raw_text: str) -> Dict:
+        async with semaphore:
+            return await structure_with_groq(raw_text)
+
+    return list(await asyncio.gather(*(process(raw_text) for raw_text in texts)))
+
+
+async def structure_batch(texts: Sequence[str]) -> List[Dict]:
+    """Structure several short documents, packing them into shared Groq requests.
+
+    Documents are grouped until a request reaches GROQ_CHUNK_SIZE; any group the
+    model does not answer one result per document falls back to per-document calls.
+    """
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        logger.warning("GROQ_API_KEY not configured; returning empty field set")
+        return [{"fields": []} for _ in texts]
+
+    results: List[Optional[Dict]] = [None] * len(texts)
+    cache_keys = [_cache_key(raw_text) for raw_text in texts]
+    # Same regex fast path as structure_with_groq, applied per document
+    local_fields: List[Optional[Dict]] = [
+        local_extract(raw_text) if GROQ_LOCAL_MIN_FIELDS > 0 else None for raw_text in texts
+    ]
+    batches: List[List[Tuple[int, str]]] = []
+    batch_size = 0
+    for index, raw_text in enumerate(texts):
+        local = local_fields[index]
+        if local is not None and len(local["fields"]) >= GROQ_LOCAL_MIN_FIELDS:
+            logger.info(
+                "Regex pass found %d fields for document %d; skipping Groq", len(local["fields"]), index
+            )
+            results[index] = local
+            continue
+        cached = _cache_get(cache_keys[index])
+        if cached is not None:
+            results[index] = _add_missed_local_fields(cached, local, None)
+            continue
+        compressed = _compress(raw_text)
+        if not batches or batch_size + len(compressed) > GROQ_CHUNK_SIZE:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append((index, compressed))
+        batch_size += len(compressed)
+
+    semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+    async def process(batch_index: int, batch: List[Tuple[int, str]]) -> None:
+        # Single documents (including oversized ones) go through the chunked path
+        per_document = None
+        if len(batch) > 1:
+            async with semaphore:
+                per_document = await _extract_from_batch(
+                    [text for _, text in batch], api_key, batch_index
+                )
+        if per_document is None:
+            structured = await asyncio.gather(*(structure_with_groq(texts[index]) for index, _ in batch))
+            for (index, _), document in zip(batch, structured):
+                results[index] = document
+            return
+        for (index, _), fields in zip(batch, per_document):
+            answer = {"fields": fields}
+            if fields:
+                _cache_put(cache_keys[index], answer)
+            results[index] = _add_missed_local_fields(answer, local_fields[index], None)
+
+    await asyncio.gather(*(process(batch_index, batch) for batch_index, batch in enumerate(batches)))
+    return [result if result is not None else {"fields": []} for result in results]
+
+
+def structure_with_groq_sync(raw_text: str) -> Dict:
+    """Blocking wrapper around structure_with_groq for callers without an event loop."""
+
+    async def run() -> Dict:
+        # The client is bound to this throwaway loop, so close it before the loop ends
+        try:
+            return await structure_with_groq(raw_text)
+        finally:
+            await _close_http_client()
+
+    return asyncio.run(run())
+
+
+async def iter_fields(raw_text: str) -> AsyncIterator[Dict]:
+    """Yield fields as Groq streams them instead of waiting for the whole document."""
+    queue: "asyncio.Queue[Dict]" = asyncio.Queue()
+    task = asyncio.ensure_future(structure_with_groq(raw_text, on_field=queue.put_nowait))
+    try:
+        while not (task.done() and queue.empty()):
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        task.result()  # Surface unexpected errors
+    finally:
+        task.cancel()
+
+
+async def structure_with_groq(raw_text: str, on_field: Optional[FieldCallback] = None) -> Dict:
+    """Send raw text to Groq and return structured JSON fields.
+
+    If on_field is given, responses are streamed and each field is also passed to it
+    as soon as it is parsed.
+    """
+    local: Optional[Dict] = None
+    if GROQ_LOCAL_MIN_FIELDS > 0:
+        local = local_extract(raw_text)
+        if len(local["fields"]) >= GROQ_LOCAL_MIN_FIELDS:
+            logger.info("Regex pass found %d fields; skipping Groq", len(local["fields"]))
+            return _emit_all(local, on_field)
 
-def structure_with_groq(raw_text: str) -> Dict:
-    """Send raw text to Groq and return structured JSON fields."""
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         logger.warning("GROQ_API_KEY not configured; returning empty field set")
         return {"fields": []}
 
+    cache_key = _cache_key(raw_text)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Groq cache hit for %s", cache_key[:12])
+        _emit_all(cached, on_field)
+        return _add_missed_local_fields(cached, local, on_field)
+
     # Process in chunks if text is long
-    all_fields = []
-    chunk_size = 25000  # Increased chunk size
-    text_chunks = _split_text_into_chunks(raw_text, chunk_size)
-    
-    for chunk_index, chunk in enumerate(text_chunks):
-        logger.info(f"Processing chunk {chunk_index + 1}/{len(text_chunks)}")
-        fields = _extract_from_chunk(chunk, api_key, chunk_index)
-        all_fields.extend(fields)
+    text_chunks = _split_text_into_chunks(_compress(raw_text), GROQ_CHUNK_SIZE)
+    semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+    async def process(chunk_index: int, chunk: str) -> Optional[List[Dict]]:
+        async with semaphore:
+            logger.info("Processing chunk %d/%d", chunk_index + 1, len(text_chunks))
+            return await _extract_from_chunk(chunk, api_key, chunk_index, on_field)
+
+    # Chunks are independent, so they are sent concurrently; gather keeps their order
+    results = await asyncio.gather(
+        *(process(chunk_index, chunk) for chunk_index, chunk in enumerate(text_chunks))
+    )
+    all_fields = [field for fields in results if fields for field in fields]
+    structured = {"fields": all_fields}
+
+    # Only cache complete answers; a failed chunk should be retried next time
+    if all_fields and all(fields is not None for fields in results):
+        _cache_put(cache_key, structured)
+    if not any(fields is not None for fields in results):
+        return structured  # Groq failed outright; do not mask it with regex fields
     
-    return {"fields": all_fields}
+    return _add_missed_local_fields(structured, local, on_field)
+
+
+def local_extract(raw_text: str) -> Dict:
+    """Find dates, dollar amounts and policy numbers with regexes, without calling Groq.
+
+    Snippets are the matched text itself, so the mapper can locate them exactly.
+    """
+    fields = []
+    seen = set()
+    for label, pattern in _LOCAL_PATTERNS:
+        for match in pattern.finditer(raw_text):
+            value = match.group(0)
+            if (label, value) in seen:
+                continue
+            seen.add((label, value))
+            fields.append({"label": label, "value": value, "snippet": value})
+    return {"fields": fields}
+
+
+def _add_missed_local_fields(
+    structured: Dict,
+    local: Optional[Dict],
+    on_field: Optional[FieldCallback],
+) -> Dict:
+    """Append regex fields whose value Groq did not already return."""
+    if local is None:
+        return structured
+    known = {field["value"] for field in structured["fields"]}
+    missed = [field for field in local["fields"] if field["value"] not in known]
+    _emit_all({"fields": missed}, on_field)
+    return {"fields": structured["fields"] + missed}
+
+
+def _emit_all(structured: Dict, on_field: Optional[FieldCallback]) -> Dict:
+    if on_field is not None:
+        for field in structured["fields"]:
+            on_field(field)
+    return structured
+
+
+def _cache_key(raw_text: str) -> str:
+    digest = hashlib.blake2b(raw_text.encode("utf-8"), digest_size=32)
+    digest.update(f"\0{MODEL_NAME}\0{PROMPT_VERSION}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _memory_cache_put(key: str, structured: Dict) -> None:
+    with _MEMORY_CACHE_LOCK:
+        _MEMORY_CACHE[key] = structured
+        _MEMORY_CACHE.move_to_end(key)
+        while len(_MEMORY_CACHE) > GROQ_MEMORY_CACHE_MAX_ENTRIES:
+            _MEMORY_CACHE.popitem(last=False)
+
+
+def _cache_get(key: str) -> Optional[Dict]:
+    with _MEMORY_CACHE_LOCK:
+        structured = _MEMORY_CACHE.get(key)
+        if structured is not None:
+            _MEMORY_CACHE.move_to_end(key)
+            return structured
+
+    path = GROQ_CACHE_DIR / f"{key}.json"
+    try:
+        structured = orjson.loads(path.read_bytes())
+        os.utime(path)  # mark as recently used for LRU eviction
+    except (OSError, ValueError):
+        return None
+    _memory_cache_put(key, structured)
+    return structured
+
+
+def _cache_put(key: str, structured: Dict) -> None:
+    _memory_cache_put(key, structured)
+    try:
+        GROQ_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (GROQ_CACHE_DIR / f"{key}.json").write_bytes(orjson.dumps(structured))
+        entries = sorted(GROQ_CACHE_DIR.glob("*.json"), key=lambda item: item.stat().st_mtime)
+        for stale in entries[: max(len(entries) - GROQ_CACHE_MAX_ENTRIES, 0)]:
+            stale.unlink(missing_ok=True)
+    except OSError as exc:
+        logger.warning("Unable to write Groq cache entry: %s", exc)
+
+
+def _compress(text: str) -> str:
+    """Shrink the prompt without rewording it: collapse blank runs and drop repeated lines.
+
+    Each extracted line is a whole page, so repeated lines are duplicate pages. Words
+    are never altered, keeping snippets locatable by the mapper's whitespace-normalized
+    strategies.
+    """
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = _HSPACE_RE.sub(" ", line).strip()
+        if not line:
+            continue
+        if len(line) >= _DEDUP_MIN_LINE_LENGTH:
+            if line in seen:
+                continue
+            seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
 
 
 def _split_text_into_chunks(text: str, chunk_size: int) -> List[str]:
-    """Split text into overlapping chunks to avoid missing data at boundaries."""
+    """Split text into overlapping chunks to avoid missing data at boundaries.
+
+    Chunk ends and overlap starts are moved to whitespace so no word (and so no
+    token) is cut in half; page breaks are preferred when one is close enough.
+    """
     if len(text) <= chunk_size:
         return [text]
     
@@ -49,99 +472,273 @@ def _split_text_into_chunks(text: str, chunk_size: int) -> List[str]:
     start = 0
     while start < len(text):
         end = min(start + chunk_size, len(text))
+        if end < len(text):
+            boundary = text.rfind("\n", start + chunk_size // 2, end)
+            if boundary < 0:
+                boundary = text.rfind(" ", start + chunk_size // 2, end)
+            if boundary > start + overlap:
+                end = boundary
         chunks.append(text[start:end])
-        start = end - overlap if end < len(text) else end
+        if end >= len(text):
+            break
+        word_start = text.find(" ", end - overlap, end)
+        start = word_start + 1 if word_start >= 0 else end - overlap
     return chunks
 
 
-def _extract_from_chunk(text_chunk: str, api_key: str, chunk_index: int) -> List[Dict]:
-    """Extract fields from a single text chunk."""
-    system_prompt = """You are a precise document extraction assistant. Extract ALL data from the document text.
+async def _extract_from_chunk(
+    text_chunk: str,
+    api_key: str,
+    chunk_index: int,
+    on_field: Optional[FieldCallback] = None,
+) -> Optional[List[Dict]]:
+    """Extract fields from a single text chunk; None if the request failed.
 
-CRITICAL RULES:
-1. The 'snippet' field MUST contain the EXACT text as it appears in the document - copy it character by character
-2. Extract EVERY piece of information: headers, labels, values, table cells, dates, amounts, IDs, names, descriptions
-3. For table data, use label format: "TableName[row].ColumnName" (e.g., "Claims[0].Amount")
-4. Do NOT paraphrase or modify the text - use exact matches only
-5. Include ALL rows from ALL tables
-6. Extract both the label/header AND its corresponding value
+    When on_field is given the completion is streamed and each field is handed to
+    it as soon as its JSON object closes.
+    """
+    payload = _build_payload(_SYSTEM_MESSAGE, _USER_PROMPT_PREFIX + text_chunk + _USER_PROMPT_SUFFIX)
 
-Return JSON with format:
-{
-  "fields": [
-    {"label": "descriptive_name", "value": "the extracted value", "snippet": "EXACT text from document"}
-  ]
-}
+    try:
+        if on_field is not None:
+            # Groq's JSON mode does not stream; the prompt already asks for JSON only
+            del payload["response_format"]
+            payload["stream"] = True
+            return await _stream_fields(_get_http_client(api_key), payload, chunk_index, on_field)
+        response = await _post_with_retries(_get_http_client(api_key), payload, chunk_index)
+        content = orjson.loads(response.content)["choices"][0]["message"]["content"]
+        result = _ensure_json_dict(content)
+        return _clean_fields(result.get("fields", []))
+    except httpx.HTTPStatusError as exc:
+        # Reading .text decodes the whole body; only do it when the record will be emitted,
+        # and cap it since some error pages are megabytes of HTML
+        if logger.isEnabledFor(logging.ERROR):
+            body = getattr(getattr(exc, "response", None), "text", "")
+            logger.error("Groq HTTP error: %s - Response: %s", exc, body[:_ERROR_BODY_LIMIT])
+        return None
+    except Exception as exc:
+        if logger.isEnabledFor(logging.ERROR):
+            logger.error("Groq structuring failed: %s", str(exc)[:_ERROR_BODY_LIMIT])
+        return None
 
-The snippet is used to locate and highlight the text in the PDF, so it MUST be an exact substring from the input."""
 
-    user_prompt = f"""Extract ALL data from this document section. For each piece of data:
-- label: A descriptive name for the field
-- value: The actual value/content
-- snippet: The EXACT text as it appears (copy-paste from document)
+async def _extract_from_batch(
+    documents: Sequence[str],
+    api_key: str,
+    batch_index: int,
+) -> Optional[List[List[Dict]]]:
+    """Extract fields for several documents in one request; None unless every document is answered."""
+    document_text = "".join(f"\n\n===DOC {index}===\n{text}" for index, text in enumerate(documents))
+    user_prompt = f"""Extract ALL data from each of these {len(documents)} documents.
 
-Document text:
-{text_chunk}
+Documents:{document_text}
 
 Return compact JSON only."""
 
-    payload = {
-        "model": MODEL_NAME,
-        "temperature": 0.1,  # Lower temperature for more accurate extraction
-        "max_tokens": 8000,
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-    }
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+    payload = _build_payload(_BATCH_SYSTEM_MESSAGE, user_prompt)
 
     try:
-        response = requests.post(GROQ_ENDPOINT, headers=headers, json=payload, timeout=120)
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        result = _ensure_json_dict(content)
-        fields = result.get("fields", [])
-        
-        # Validate and clean fields
-        validated_fields = []
-        for field in fields:
-            if not isinstance(field, dict):
-                continue
-            label = field.get("label") or field.get("name") or "Unknown"
-            value = str(field.get("value", "")).strip()
-            snippet = str(field.get("snippet", "")).strip() or value
-            
-            if value:  # Only include fields with values
-                validated_fields.append({
-                    "label": label,
-                    "value": value,
-                    "snippet": snippet,
-                })
-        
-        return validated_fields
-    except requests.exceptions.HTTPError as exc:
-        logger.error("Groq HTTP error: %s - Response: %s", exc, exc.response.text if hasattr(exc, 'response') else 'No response')
-        return []
+        response = await _post_with_retries(_get_http_client(api_key), payload, batch_index)
+        content = orjson.loads(response.content)["choices"][0]["message"]["content"]
+        entries = _ensure_json_dict(content).get("results")
     except Exception as exc:
-        logger.error("Groq structuring failed: %s", exc)
+        logger.warning("Groq batch %d failed (%s); structuring documents individually", batch_index + 1, exc)
+        return None
+
+    if not isinstance(entries, list) or len(entries) != len(documents):
+        logger.warning(
+            "Groq batch %d returned %s results for %d documents; structuring individually",
+            batch_index + 1,
+            len(entries) if isinstance(entries, list) else "no",
+            len(documents),
+        )
+        return None
+    return [_clean_fields(entry.get("fields") if isinstance(entry, dict) else None) for entry in entries]
+
+
+async def _stream_fields(
+    client: httpx.AsyncClient,
+    payload: Dict,
+    chunk_index: int,
+    on_field: FieldCallback,
+) -> List[Dict]:
+    """Read a streamed completion, emitting each "fields" item as soon as it is complete."""
+    response = await _post_with_retries(client, payload, chunk_index, stream=True)
+    items = ijson.sendable_list()
+    parser = ijson.items_coro(items, "fields.item", use_float=True)
+    parts: List[str] = []
+    fields: List[Dict] = []
+    try:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            content = orjson.loads(data)["choices"][0]["delta"].get("content")
+            if not content:
+                continue
+            parts.append(content)
+            if parser is None:
+                continue
+            try:
+                parser.send(content.encode("utf-8"))
+            except ijson.JSONError:
+                parser = None  # Not bare JSON (e.g. wrapped in prose); parse it at the end
+            for field in _clean_fields(items):
+                fields.append(field)
+                on_field(field)
+            del items[:]
+    finally:
+        await response.aclose()
+
+    if parser is not None:
+        try:
+            parser.close()
+            return fields
+        except ijson.JSONError:
+            pass
+    # Incremental parse failed: recover from the full text and emit whatever was not sent yet
+    recovered = _clean_fields(_ensure_json_dict("".join(parts)).get("fields", []))
+    for field in recovered[len(fields):]:
+        on_field(field)
+    return recovered
+
+
+def _build_payload(system_message: Dict, user_prompt: str) -> Dict:
+    return {**_PAYLOAD_BASE, "messages": [system_message, {"role": "user", "content": user_prompt}]}
+
+
+def _clean_fields(fields: object) -> List[Dict]:
+    """Normalise model output to {label, value, snippet} dicts, dropping empty values."""
+    if not isinstance(fields, list):
         return []
+    validated_fields = []
+    for field in fields:
+        if not isinstance(field, dict):
+            continue
+        label = field.get("label") or field.get("name") or "Unknown"
+        value = str(field.get("value", "")).strip()
+        snippet = str(field.get("snippet", "")).strip() or value
+
+        if value:  # Only include fields with values
+            validated_fields.append({
+                "label": label,
+                "value": value,
+                "snippet": snippet,
+            })
+    return validated_fields
+
+
+async def _post_with_retries(
+    client: httpx.AsyncClient,
+    payload: Dict,
+    chunk_index: int,
+    stream: bool = False,
+) -> httpx.Response:
+    """POST to Groq, retrying with jittered exponential backoff within GROQ_TOTAL_TIMEOUT.
+
+    Retries timeouts, dropped connections and 429/5xx responses; raises the last error, and
+    fails fast when Groq asks to wait longer than GROQ_MAX_RETRY_WAIT.
+    With stream=True the body is left unread and the caller must close the response.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + GROQ_TOTAL_TIMEOUT
+    content = orjson.dumps(payload)
+    attempt = 0
+    while True:
+        attempt += 1
+        final = attempt >= GROQ_MAX_ATTEMPTS
+        delay = 0.5 * 2 ** (attempt - 1) + random.uniform(0, 0.25)
+        timeout = httpx.Timeout(min(GROQ_REQUEST_TIMEOUT, deadline - loop.time()), connect=3.0)
+        request = client.build_request("POST", GROQ_ENDPOINT, content=content, timeout=timeout)
+        try:
+            response = await client.send(request, stream=stream)
+        # A dropped connection (reset, GOAWAY) fails every chunk multiplexed over it,
+        # so transport errors are retried as well as timeouts
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as exc:
+            if final or deadline - loop.time() < delay + _MIN_ATTEMPT_TIME:
+                raise
+            logger.warning("Groq chunk %d attempt %d failed (%s); retrying", chunk_index + 1, attempt, exc)
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code in _RETRYABLE_STATUSES and not final:
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            if delay <= GROQ_MAX_RETRY_WAIT and deadline - loop.time() >= delay + _MIN_ATTEMPT_TIME:
+                await response.aclose()
+                logger.warning(
+                    "Groq chunk %d attempt %d returned HTTP %d; retrying in %.1fs",
+                    chunk_index + 1,
+                    attempt,
+                    response.status_code,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+                continue
+            logger.warning(
+                "Groq chunk %d returned HTTP %d and needs %.1fs before a retry; giving up",
+                chunk_index + 1,
+                response.status_code,
+                delay,
+            )
+        await _raise_for_status(response)
+        logger.info("Groq chunk %d succeeded on attempt %d", chunk_index + 1, attempt)
+        return response
+
+
+async def _raise_for_status(response: httpx.Response) -> None:
+    if response.is_error:
+        # Streamed error bodies are unread; load them so the error can be logged
+        await response.aread()
+        await response.aclose()
+        response.raise_for_status()
 
 
 def _ensure_json_dict(content: str) -> Dict:
+    # stdlib json on purpose: orjson turns integers wider than 64 bits into floats,
+    # which would corrupt unquoted account or claim numbers in the model's answer
     try:
         return json.loads(content)
     except json.JSONDecodeError:
-        match = re.search(r"\{.*\}", content, re.DOTALL)
-        if match:
+        candidate = _first_json_object(content)
+        if candidate is not None:
             try:
-                return json.loads(match.group(0))
+                return json.loads(candidate)
             except json.JSONDecodeError:
                 pass
         logger.warning("Unable to parse Groq response; returning empty fields")
         return {"fields": []}
+
+
+def _first_json_object(content: str) -> Optional[str]:
+    """Return the first balanced {...} in content, skipping braces inside strings.
+
+    A single forward pass, so prose around the JSON cannot cause regex backtracking.
+    """
+    start = content.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escape = False
+    for index in range(start, len(content)):
+        char = content[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return content[start:index + 1]
+    return None